@@ -4,21 +4,33 @@ import datetime
 from zoneinfo import ZoneInfo
 
 GITHUB_USER_NAME = "nicojahn"
+PROFILE_REPO_FULL_NAME = f"{GITHUB_USER_NAME}/{GITHUB_USER_NAME}"
 TZ = "Europe/Berlin"
 MAX_RECENT_ACTIVITY = 14  # days
 MAX_REPOS_LISTED = 5  # number of repositories
-DT_DATE = datetime.datetime.now(ZoneInfo(TZ))
+CACHE_FILENAME = ".gh_repos_cache.json"
+CACHE_TTL = 1800  # seconds
+MMAP_THRESHOLD = 262144  # bytes, larger README templates are mmap'ed
 
-dynamic_information = {
-    "city": "Berlin",
-    "contact": (
-        ":email: dev@nicojahn.com, "
-        + ":octocat: [nicoja-hn](https://github.com/nicoja-hn), "
-        + ":computer: [nicoja.hn](https://nicoja.hn)"
-    ),
-    "date": DT_DATE.strftime("%A, %d %B %Y, %Z"),
-    "filename": "README.md",
-    "github": f"github.com/{GITHUB_USER_NAME}",
-    "name": "Nico Jahn",
-    "projects": None,
-}
+
+def get_now():
+    """Returns the current time in 'TZ'."""
+    return datetime.datetime.now(ZoneInfo(TZ))
+
+
+def build_dynamic_information(now):
+    """Returns the values for the README tags, 'date' is formatted from the
+    datetime 'now'."""
+    return {
+        "city": "Berlin",
+        "contact": (
+            ":email: dev@nicojahn.com, "
+            + ":octocat: [nicoja-hn](https://github.com/nicoja-hn), "
+            + ":computer: [nicoja.hn](https://nicoja.hn)"
+        ),
+        "date": now.strftime("%A, %d %B %Y, %Z"),
+        "filename": "README.md",
+        "github": f"github.com/{GITHUB_USER_NAME}",
+        "name": "Nico Jahn",
+        "projects": None,
+    }
@@ -4,210 +4,278 @@
 GitHub stats of a user).
 """
 import datetime
+import json
+import mmap
+import os
 import re
-from functools import reduce
-from operator import add
-from zoneinfo import ZoneInfo
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.adapters import Retry
 
-from data import DT_DATE
-from data import dynamic_information
+from data import build_dynamic_information
+from data import CACHE_FILENAME
+from data import CACHE_TTL
+from data import get_now
 from data import GITHUB_USER_NAME
 from data import MAX_RECENT_ACTIVITY
 from data import MAX_REPOS_LISTED
+from data import MMAP_THRESHOLD
+from data import PROFILE_REPO_FULL_NAME
+
+# one keep-alive connection to the GitHub API, reused by all requests of this process
+#  (transient connection errors are retried with a short backoff)
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=1,
+        max_retries=Retry(total=3, backoff_factor=0.3),
+    ),
+)
+_SESSION.headers.update(
+    {"Accept": "application/vnd.github+json", "User-Agent": GITHUB_USER_NAME}
+)
+
+_SECONDS_PER_DAY = 86400
+
+_REPOSITORY_TEMPLATE = (
+    "repository [{full_name}]({html_url}) which was updated {days} days ago{language}"
+)
+
+
+def fetch_repos_cached(path=CACHE_FILENAME):
+    """Returns the repositories of 'GITHUB_USER_NAME' as list of dicts.
+
+    The response is cached on disk together with its ETag. Within
+    'CACHE_TTL' seconds the cache is used as is, afterwards a
+    conditional request is sent and the cached body is reused if GitHub
+    answers with 304 (Not Modified).
+    """
+    # sorted and limited by GitHub, one more than listed to skip the profile repo
+    url = (
+        f"https://api.github.com/users/{GITHUB_USER_NAME}/repos"
+        + f"?sort=updated&direction=desc&per_page={MAX_REPOS_LISTED + 1}"
+    )
+    cache = _load_cache(path, url)
+    if cache and time.time() - cache["fetched_at"] < CACHE_TTL:
+        return cache["body"]
+
+    headers = {"If-None-Match": cache["etag"]} if cache.get("etag") else {}
+    resp = _SESSION.get(url, headers=headers, timeout=10)
+    if resp.status_code == 304:
+        # not modified, the body is empty and the cached one is still valid
+        #  (restart the TTL, otherwise every later run revalidates again)
+        cache["fetched_at"] = time.time()
+        _store_cache(path, cache)
+        return cache["body"]
+    # an error response would otherwise be parsed and cached as repositories
+    resp.raise_for_status()
+
+    cache = {
+        "url": url,
+        "etag": resp.headers.get("ETag"),
+        "fetched_at": time.time(),
+        "body": resp.json(),
+    }
+    _store_cache(path, cache)
+    return cache["body"]
+
+
+def _load_cache(path, url):
+    """Returns the cached response of 'url' stored at 'path' or an empty dict
+    if there is no usable cache."""
+    try:
+        with open(path, "r", encoding="utf-8") as cache_file:
+            cache = json.load(cache_file)
+        # a cache of a different request is of no use
+        if cache["url"] != url or "body" not in cache:
+            return {}
+        cache["fetched_at"] = float(cache["fetched_at"])
+    except (OSError, ValueError, KeyError, TypeError):
+        # missing, truncated or otherwise broken, it is simply rebuilt
+        return {}
+    return cache
+
+
+def _store_cache(path, cache):
+    """Writes 'cache' to 'path' via a temporary file, so an interrupted write
+    never leaves a truncated cache behind."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as cache_file:
+        json.dump(cache, cache_file)
+    os.replace(tmp_path, path)
+
+
+def calculate_days_since_update(latest_change_str, now_timestamp):
+    """Returns the number of full days between the POSIX timestamp
+    'now_timestamp' and the ISO 8601 UTC timestamp 'latest_change_str' (e.g.
+    '2022-04-01T12:00:00Z')."""
+    # fromisoformat is a C fast path, but only understands 'Z' from python 3.11 on
+    latest_change = datetime.datetime.fromisoformat(
+        latest_change_str.replace("Z", "+00:00")
+    )
+    # plain float arithmetics instead of subtracting two timezone aware datetimes
+    return int((now_timestamp - latest_change.timestamp()) // _SECONDS_PER_DAY)
+
+
+def create_repository_description(response, days):
+    """Returns the text snippet for a repository, which was updated 'days'
+    ago."""
+    language = response["language"]
+    language_info = "" if language is None else f" and is mainly written in {language}"
+    return _REPOSITORY_TEMPLATE.format(
+        full_name=response["full_name"],
+        html_url=response["html_url"],
+        days=days,
+        language=language_info,
+    )
 
 
-def get_first_n_recent_projects(all_repositories):
-    """Returns at most 'MAX_REPOS_LISTED' which where modified in the last
-    'MAX_RECENT_ACTIVITY' days."""
-    # Testing the walrus-operator
-    i = 0
-    projects = []
-    for repo in all_repositories:
-        if (
-            not repo[1] is None and repo[0] < MAX_RECENT_ACTIVITY
-        ):  # Filtering the profile repo
-            if (i := i + 1) <= MAX_REPOS_LISTED:
-                projects += [repo[1]]
-    return projects
-
-
-def get_single_most_recent_project(all_repositories):
-    """Return first repo in list, where you are a maintainer."""
-    # Fixing the bug of no activity
-    projects = []
-    for repo in all_repositories:
-        # Is None, if it is not your project
-        if not repo[1] is None:
-            projects = [repo[1]]
-            break
-    return projects
-
-
-def get_github_activity():
+def get_github_activity(now):
     """This functions updates a dictionary with prepared text snippets, based
-    on the GitHub activity."""
-    # some misc functions
-    latest_change_in_days = lambda latest_change_str: (
-        DT_DATE
-        - datetime.datetime.strptime(latest_change_str, "%Y-%m-%dT%H:%M:%SZ").replace(
-            tzinfo=ZoneInfo("UTC")
-        )
-    ).days
-
-    # when repository is not not the profile itself it returns a string else None (filtered later)
-    make_string = (
-        lambda response: (
-            f"repository [{response['full_name']}]({response['html_url']}) which was updated "
-            + f"{latest_change_in_days(response['updated_at'])} days ago"
-            + f"{' and is mainly written in '+response['language'] if response['language'] is not None else ''}"
-        )
-        if response["full_name"] != f"{GITHUB_USER_NAME}/{GITHUB_USER_NAME}"
-        else None
-    )
-
+    on the GitHub activity relative to the datetime 'now'."""
     # the actual request to the GitHub API
     # default response timezone:
     #  https://developer.github.com/v3/#defaulting-to-utc-without-other-timezone-information
-    req = requests.get(f"https://api.github.com/users/{GITHUB_USER_NAME}/repos").json()
-
-    # the reformatting and selection of repositories
-    #  (matching criteria of latest changes and maximum amount)
-    # getting a list of tuples of (days,string)
-    all_repositories = sorted(
-        [
-            [latest_change_in_days(response["updated_at"]), make_string(response)]
-            for response in req
-        ],
-        key=lambda time_and_string: time_and_string[0],
-    )
-
-    projects = get_first_n_recent_projects(all_repositories)
-    if len(projects) == 0:
-        projects = get_single_most_recent_project(all_repositories)
+    req = fetch_repos_cached()
+    now_timestamp = now.timestamp()
+    # local names for the globals used inside the loop (LOAD_FAST over LOAD_GLOBAL)
+    profile_repo_full_name = PROFILE_REPO_FULL_NAME
+    max_recent_activity = MAX_RECENT_ACTIVITY
+    max_repos_listed = MAX_REPOS_LISTED
+
+    # the selection of repositories (matching criteria of latest changes and
+    #  maximum amount), the response is already sorted by the latest change
+    projects = []
+    for response in req:
+        # Filtering the profile repo
+        if response["full_name"] == profile_repo_full_name:
+            continue
+        days = calculate_days_since_update(response["updated_at"], now_timestamp)
+        if days >= max_recent_activity:
+            # Fixing the bug of no activity: use just the most recent one
+            if not projects:
+                projects.append(create_repository_description(response, days))
+            break
+        projects.append(create_repository_description(response, days))
+        if len(projects) == max_repos_listed:
+            break
 
-    # either use the n most recent projects or if no filter applies, use just the most recent
     return " as well as ".join(projects)
 
 
+def _read_template(path):
+    """Just reads the 'path' file and returns its content.
+
+    Templates larger than 'MMAP_THRESHOLD' bytes are returned as read-
+    only mmap instead, so they are scanned from the page cache without
+    decoding.
+    """
+    if os.path.getsize(path) > MMAP_THRESHOLD:
+        with open(path, "rb") as input_file:
+            return mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+    with open(path, "r", encoding="utf-8") as input_file:
+        return input_file.read()
+
+
 class UpdateREADME:
     """This class is reading the README template, fill in the gaps and writes
     it again onto disk."""
 
+    OPEN_SEQ = "<!-- "
+    CLOSE_SEQ = " -->"
+    # '<!-- key -->value<!-- key -->', the value must not open another tag
+    #  and the closing tag has to match the opening one (compiled once on import)
+    # the substitution is pure string work, keep it on compiled 're' and str methods
+    #  (both implemented in C), JIT compilers like numba do not speed up strings
+    # keys are ASCII words ('re.ASCII'), like in the bytes twin below
+    _TAG_RE = re.compile(
+        rf"({re.escape(OPEN_SEQ)}(\w+){re.escape(CLOSE_SEQ)})"
+        + rf"(?:(?!{re.escape(OPEN_SEQ)}).)*?\1",
+        re.ASCII,
+    )
+    # the same pattern for large templates, which are processed as (mmap'ed) bytes
+    _TAG_BYTES_RE = re.compile(_TAG_RE.pattern.encode("utf-8"), re.ASCII)
+
     def __init__(self, **kwargs):
         """Expects the dictionary with the mandatory key 'filename'.
 
         Everything else is done dynamically.
         """
         self.information = kwargs
-        self.keys = self.information.keys()
         self.filename = self.information["filename"]
-        self.content = None
 
-    def read_file_content(self):
-        """Just reads the 'filename' file and returns it by list."""
-        with open(self.filename, "r", encoding="utf-8") as input_file:
-            self.content = input_file.readlines()
-        return self
-
-    def write_file_content(self):
-        """Writes the strings in the 'self.content' list to file 'filename'."""
-        with open(self.filename, "w", encoding="utf-8") as output_file:
-            output_file.write("".join(self.content))
-        return self
-
-    @property
-    def open_seq(self):
-        return "<!-- "
-
-    @property
-    def close_seq(self):
-        return " -->"
-
-    @staticmethod
-    def _is_true(i, j):
-        return i and j
-
-    @staticmethod
-    def _equals(i, j):
-        return i == j
-
-    @staticmethod
-    def _is_none(i):
-        return UpdateREADME._equals(i, None)
-
-    @staticmethod
-    def _is_not_none(i):
-        return UpdateREADME._equals(i, not None)
-
-    def _process_lines(self, line):
-        if not self.open_seq in line:
-            return line
-
-        # Get pairs of 2 tokens each
-        line_split = line.split(self.open_seq)
-        sliding_window_size = 2
-        tuples = [
-            line_split[i : i + sliding_window_size]
-            for i, _ in enumerate(line_split[: 1 - sliding_window_size])
-        ]
-
-        for tup in tuples:
-            # find applicable key/value pairs in the original line
-            key, value = None, None
-            for elem in tup:
-                if not self.close_seq in elem:
-                    break
-                key_value = list(elem.split(self.close_seq))
-                # even though the number of variables is fixed,
-                #  i prefer map-reduce over hardcoded indices
-                if len(key_value) == 2 and reduce(
-                    self._is_true, map(self._is_none, [key, value])
-                ):
-                    key, value = key_value
-                elif reduce(self._equals, map(self._is_not_none, [key, value])):
-                    # if the sliding window does contain 2 different tags, remove it
-                    if reduce(
-                        self._equals,
-                        map(
-                            lambda x: not self._equals(*x),
-                            zip([key, value], key_value),
-                        ),
-                    ):
-                        key, value = None, None
-                        break
-
-            # replace the content
-            if reduce(self._equals, map(self._is_not_none, [key, value])):
-                for k in self.keys:
-                    if self._equals(k, key):
-                        tag = self.open_seq + key + self.close_seq
-                        # an example of regex beeing used
-                        #  (no wildcard necessary, 'value' is escaped)
-                        span = re.search(tag + re.escape(value) + tag, line).span()
-                        # tuple arithmetics
-                        remove = tuple(map(add, span, (len(tag), -len(tag))))
-                        line = (
-                            line[: remove[0]]
-                            + self.information[key]
-                            + line[remove[1] :]
-                        )
-        return line
-
-    def update_content(self):
-        self.content = list(map(self._process_lines, self.content))
+    def _replace_tag(self, match):
+        """Replaces the value between a pair of identical tags, if the key is
+        known and has a value."""
+        tag, key = match.groups()
+        is_bytes = isinstance(key, bytes)
+        replacement = self.information.get(key.decode("utf-8") if is_bytes else key)
+        if replacement is None:
+            return match[0]
+        if is_bytes:
+            replacement = replacement.encode("utf-8")
+        return tag + replacement + tag
+
+    def update_content(self, text):
+        """Returns 'text' with all known tags filled in.
+
+        'text' is either a str or (for large templates) a bytes-like
+        object, the result is of type str or bytes respectively.
+        """
+        if isinstance(text, str):
+            # fast path: without any tag there is nothing to substitute
+            if self.OPEN_SEQ not in text:
+                return text
+            return self._TAG_RE.sub(self._replace_tag, text)
+        # 'in' on a mmap only tests for single bytes, hence 'find'
+        if text.find(self.OPEN_SEQ.encode("utf-8")) == -1:
+            return bytes(text)
+        return self._TAG_BYTES_RE.sub(self._replace_tag, text)
+
+    def process(self, text=None):
+        """Fills in the gaps of 'text' (read from 'filename' if not given) and
+        writes it to 'filename'."""
+        if text is None:
+            text = _read_template(self.filename)
+        if isinstance(text, mmap.mmap):
+            # release the mapping (also on errors) before the file gets truncated
+            with text:
+                content = self.update_content(text)
+        else:
+            content = self.update_content(text)
+        if isinstance(content, str):
+            with open(self.filename, "w", encoding="utf-8") as output_file:
+                output_file.write(content)
+        else:
+            with open(self.filename, "wb") as output_file:
+                output_file.write(content)
         return self
 
 
 def main():
-    dynamic_information["projects"] = get_github_activity()
-    (
-        UpdateREADME(**dynamic_information)
-        .read_file_content()
-        .update_content()
-        .write_file_content()
-    )
+    # one clock reading per run, shared by the date and the activity
+    now = get_now()
+    dynamic_information = build_dynamic_information(now)
+    # the GitHub request and reading the template are independent,
+    #  so the disk I/O is hidden behind the network latency
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        projects = pool.submit(get_github_activity, now)
+        template = pool.submit(_read_template, dynamic_information["filename"])
+        try:
+            dynamic_information["projects"] = projects.result()
+        except BaseException:
+            # a large template is mmap'ed, release it before giving up
+            text = template.result()
+            if isinstance(text, mmap.mmap):
+                text.close()
+            raise
+        text = template.result()
+    UpdateREADME(**dynamic_information).process(text)
 
 
 if __name__ == "__main__":
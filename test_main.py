@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""Checks the GitHub repositories cache, the repository selection and the
+README template engine."""
+import datetime
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import main
+from data import CACHE_TTL
+from data import MAX_RECENT_ACTIVITY
+from data import MAX_REPOS_LISTED
+from data import PROFILE_REPO_FULL_NAME
+
+BODY = [{"full_name": "nicojahn/example"}]
+NOW = datetime.datetime(2022, 4, 15, 12, tzinfo=datetime.timezone.utc)
+
+
+def _response(status_code, body=None, etag='"v1"'):
+    """Returns a mocked 'requests.Response'."""
+    resp = mock.Mock(status_code=status_code, headers={"ETag": etag})
+    resp.json.return_value = body
+    return resp
+
+
+class FetchReposCachedTest(unittest.TestCase):
+    """Walks through the TTL / ETag states of 'fetch_repos_cached'."""
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.path = os.path.join(tmp_dir, "cache.json")
+        session = mock.patch.object(main, "_SESSION")
+        self.session = session.start()
+        self.addCleanup(session.stop)
+        clock = mock.patch.object(main.time, "time", return_value=1000.0)
+        self.clock = clock.start()
+        self.addCleanup(clock.stop)
+
+    def test_fresh_cache_skips_the_request(self):
+        """Within the TTL the cached body is returned without a request."""
+        self.session.get.return_value = _response(200, BODY)
+        self.assertEqual(main.fetch_repos_cached(self.path), BODY)
+        self.assertEqual(main.fetch_repos_cached(self.path), BODY)
+        self.assertEqual(self.session.get.call_count, 1)
+
+    def test_not_modified_restarts_the_ttl(self):
+        """A 304 reuses the cached body and starts a new TTL."""
+        self.session.get.return_value = _response(200, BODY)
+        main.fetch_repos_cached(self.path)
+
+        self.clock.return_value += CACHE_TTL + 1
+        self.session.get.return_value = _response(304)
+        self.assertEqual(main.fetch_repos_cached(self.path), BODY)
+        self.assertEqual(
+            self.session.get.call_args.kwargs["headers"], {"If-None-Match": '"v1"'}
+        )
+
+        # revalidated just now, so no further request within the TTL
+        self.assertEqual(main.fetch_repos_cached(self.path), BODY)
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_truncated_cache_is_ignored(self):
+        """A broken cache file is treated like no cache at all."""
+        with open(self.path, "w", encoding="utf-8") as cache_file:
+            cache_file.write('{"url": ')
+        self.session.get.return_value = _response(200, BODY)
+        self.assertEqual(main.fetch_repos_cached(self.path), BODY)
+        self.assertEqual(self.session.get.call_args.kwargs["headers"], {})
+
+    def test_error_response_is_not_cached(self):
+        """An error response raises and does not create a cache file."""
+        resp = _response(500)
+        resp.raise_for_status.side_effect = RuntimeError("500")
+        self.session.get.return_value = resp
+        with self.assertRaises(RuntimeError):
+            main.fetch_repos_cached(self.path)
+        self.assertFalse(os.path.exists(self.path))
+
+
+def _repo(full_name, days_ago):
+    """Returns a repository as returned by the GitHub API, updated 'days_ago'
+    days before 'NOW'."""
+    updated_at = NOW - datetime.timedelta(days=days_ago, hours=1)
+    return {
+        "full_name": full_name,
+        "html_url": f"https://github.com/{full_name}",
+        "updated_at": updated_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "language": None,
+    }
+
+
+class GetGithubActivityTest(unittest.TestCase):
+    """Selects repositories from a (server-side sorted) mocked response."""
+
+    def _activity(self, repositories):
+        """Returns the repository names picked by 'get_github_activity'."""
+        with mock.patch.object(main, "fetch_repos_cached", return_value=repositories):
+            activity = main.get_github_activity(NOW)
+        return re.findall(r"repository \[([^\]]+)\]", activity)
+
+    def test_profile_repository_is_skipped(self):
+        """The profile repository itself is never listed."""
+        repositories = [_repo(PROFILE_REPO_FULL_NAME, 0), _repo("nicojahn/a", 1)]
+        self.assertEqual(self._activity(repositories), ["nicojahn/a"])
+
+    def test_at_most_max_repos_listed(self):
+        """No more than 'MAX_REPOS_LISTED' recent repositories are listed."""
+        repositories = [_repo(f"nicojahn/r{i}", 0) for i in range(MAX_REPOS_LISTED + 1)]
+        self.assertEqual(
+            self._activity(repositories),
+            [f"nicojahn/r{i}" for i in range(MAX_REPOS_LISTED)],
+        )
+
+    def test_stops_at_first_old_repository(self):
+        """The first repository at or past 'MAX_RECENT_ACTIVITY' ends the
+        list."""
+        repositories = [
+            _repo("nicojahn/a", MAX_RECENT_ACTIVITY - 1),
+            _repo("nicojahn/b", MAX_RECENT_ACTIVITY),
+            _repo("nicojahn/c", 0),
+        ]
+        self.assertEqual(self._activity(repositories), ["nicojahn/a"])
+
+    def test_falls_back_to_most_recent_repository(self):
+        """Without recent activity only the most recent repository is
+        listed."""
+        repositories = [
+            _repo(PROFILE_REPO_FULL_NAME, 0),
+            _repo("nicojahn/a", MAX_RECENT_ACTIVITY + 5),
+            _repo("nicojahn/b", MAX_RECENT_ACTIVITY + 10),
+        ]
+        self.assertEqual(self._activity(repositories), ["nicojahn/a"])
+
+    def test_no_repositories(self):
+        """An empty response results in an empty activity."""
+        self.assertEqual(self._activity([]), [])
+
+
+class UpdateREADMETest(unittest.TestCase):
+    """Runs sample template lines through 'UpdateREADME.update_content'."""
+
+    def setUp(self):
+        self.readme = main.UpdateREADME(
+            filename="README.md", name="Nico", city="Berlin", projects=None
+        )
+
+    def test_known_tag(self):
+        """The value between two known tags is replaced, the tags are kept."""
+        self.assertEqual(
+            self.readme.update_content("Hi <!-- name -->old<!-- name -->!\n"),
+            "Hi <!-- name -->Nico<!-- name -->!\n",
+        )
+
+    def test_value_containing_close_seq(self):
+        """Only a new '<!-- ' ends a value, a ' -->' inside it does not."""
+        self.assertEqual(
+            self.readme.update_content("<!-- name -->a --> b<!-- name -->\n"),
+            "<!-- name -->Nico<!-- name -->\n",
+        )
+
+    def test_unknown_tag(self):
+        """Tags without an information entry are left untouched."""
+        text = "<!-- foo -->bar<!-- foo -->\n"
+        self.assertEqual(self.readme.update_content(text), text)
+
+    def test_mismatched_tags(self):
+        """A value never spans another tag, so only identical pairs match."""
+        text = "<!-- name -->x<!-- city -->y<!-- name -->\n"
+        self.assertEqual(self.readme.update_content(text), text)
+
+    def test_none_value(self):
+        """A key whose value is None keeps its current value."""
+        text = "<!-- projects -->old<!-- projects -->\n"
+        self.assertEqual(self.readme.update_content(text), text)
+
+    def test_two_tags_on_one_line(self):
+        """Every tag pair on a line is replaced independently."""
+        self.assertEqual(
+            self.readme.update_content(
+                "<!-- name -->a<!-- name --> in <!-- city -->b<!-- city -->\n"
+            ),
+            "<!-- name -->Nico<!-- name --> in <!-- city -->Berlin<!-- city -->\n",
+        )
+        self.assertEqual(
+            self.readme.update_content(
+                "<!-- name -->a<!-- name --><!-- name -->b<!-- name -->"
+            ),
+            "<!-- name -->Nico<!-- name --><!-- name -->Nico<!-- name -->",
+        )
+
+    def test_tag_free_text(self):
+        """Text without any tag is returned as is."""
+        text = "Just some prose.\n\nNo tags -->here.\n"
+        self.assertIs(self.readme.update_content(text), text)
+
+
+class LargeTemplateTest(unittest.TestCase):
+    """Compares the (mmap'ed) bytes path with the str path."""
+
+    TEMPLATE = (
+        "# <!-- name -->old<!-- name --> aus <!-- city -->alt<!-- city -->\n"
+        + "Umlaute: äöü <!-- foo -->ß<!-- foo --> <!-- projects -->x<!-- projects -->\n"
+    )
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.path = os.path.join(tmp_dir, "README.md")
+        self.readme = main.UpdateREADME(
+            filename=self.path, name="Nïco", city="Köln", projects=None
+        )
+
+    def test_bytes_and_str_give_the_same_result(self):
+        """The bytes path substitutes exactly like the str path."""
+        expected = self.readme.update_content(self.TEMPLATE)
+        self.assertIn("Nïco", expected)
+        self.assertEqual(
+            self.readme.update_content(self.TEMPLATE.encode("utf-8")),
+            expected.encode("utf-8"),
+        )
+
+    def test_process_round_trip_above_threshold(self):
+        """A template above 'MMAP_THRESHOLD' is mmap'ed and written back."""
+        with open(self.path, "w", encoding="utf-8") as readme_file:
+            readme_file.write(self.TEMPLATE)
+        with mock.patch.object(main, "MMAP_THRESHOLD", 16):
+            text = main._read_template(self.path)  # pylint: disable=protected-access
+            self.assertIsInstance(text, mmap.mmap)
+            self.readme.process(text)
+        self.assertTrue(text.closed)
+        with open(self.path, "r", encoding="utf-8") as readme_file:
+            self.assertEqual(
+                readme_file.read(), self.readme.update_content(self.TEMPLATE)
+            )
+
+    def test_main_closes_the_template_on_errors(self):
+        """A failing GitHub request still releases a mmap'ed template."""
+        template = mock.Mock(spec=mmap.mmap)
+        with mock.patch.object(
+            main, "get_github_activity", side_effect=RuntimeError("offline")
+        ), mock.patch.object(main, "_read_template", return_value=template):
+            with self.assertRaises(RuntimeError):
+                main.main()
+        template.close.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()